@@ -1,10 +1,11 @@
 import argparse
+import asyncio
 import os
 from dotenv import load_dotenv
 
 from src.modules.note_linker import find_and_link_notes_with_embeddings
 from src.modules.note_quality import rate_notes
-from src.models.llm_clients import OllamaClient
+from src.models.llm_clients import AsyncOllamaClient
 
 
 def main():
@@ -16,7 +17,7 @@ def main():
         print("Please set the VAULT_DIRECTORY and API_URL environment variables.")
         return
     try:
-        ollama_client = OllamaClient(API_URL)
+        ollama_client = AsyncOllamaClient(API_URL)
         print(f"Successfully connected to Ollama on url: {API_URL}")
     except Exception as e:
         print(f"Failed to connect to Ollama: {e}")
@@ -30,12 +31,20 @@ def main():
     args = parser.parse_args()
 
     if args.note_linker:
-        find_and_link_notes_with_embeddings(VAULT_DIRECTORY, ollama_client)
+        asyncio.run(run_with_client(find_and_link_notes_with_embeddings(VAULT_DIRECTORY, ollama_client), ollama_client))
     elif args.note_quality:
-        rate_notes(VAULT_DIRECTORY, ollama_client)
+        asyncio.run(run_with_client(rate_notes(VAULT_DIRECTORY, ollama_client), ollama_client))
     else:
         parser.print_help()
 
 
+async def run_with_client(task, ollama_client):
+    """
+    Runs a command and closes the client's connections afterwards.
+    """
+    async with ollama_client:
+        await task
+
+
 if __name__ == "__main__":
     main()
@@ -1,20 +1,77 @@
-import requests
+import os
+import httpx
+import orjson
 from typing import List
 
-class OllamaClient:
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+def concurrency_from_env(env_var: str, default: int = 3) -> int:
+    """
+    Reads the number of concurrent Ollama requests from an environment variable.
+
+    Args:
+        env_var (str): Name of the environment variable (e.g. "OLLAMA_CONCURRENCY").
+        default (int): Value used if the variable is unset or invalid.
+
+    Returns:
+        int: The configured concurrency, at least 1.
+    """
+    value = os.getenv(env_var)
+    if not value:
+        return default
+
+    try:
+        concurrency = int(value)
+    except ValueError:
+        print(f"{env_var} must be a whole number, got '{value}'. Using {default}.")
+        return default
+
+    if concurrency < 1:
+        print(f"{env_var} must be at least 1, got {concurrency}. Using 1.")
+        return 1
+    return concurrency
+
+class AsyncOllamaClient:
     """
-    A client to interact with a local Ollama instance for generating embeddings.
+    An asyncio client for a local Ollama instance. Concurrent requests share a pool
+    of keep-alive connections. HTTP/2 is only negotiated over TLS, so a plain
+    "http://" Ollama URL is reached over HTTP/1.1.
     """
     def __init__(self, api_base_url: str):
         """
-        Initializes the OllamaClient with the base URL of the Ollama instance.
+        Initializes the AsyncOllamaClient with the base URL of the Ollama instance.
 
         Args:
             api_base_url (str): The base url of the ollama client (e.g. "http://localhost:11434").
         """
         self.api_base_url = api_base_url.rstrip('/')
+        self.client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+            timeout=httpx.Timeout(300.0, connect=10.0)
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
 
-    def get_embedding(self, text: str, model_name: str = "nomic-embed-text") -> List[float]:
+    async def aclose(self) -> None:
+        """
+        Closes all pooled connections.
+        """
+        await self.client.aclose()
+
+    async def _post_json(self, url: str, payload: dict, timeout=httpx.USE_CLIENT_DEFAULT) -> dict:
+        """
+        Posts a JSON payload and returns the decoded JSON answer. Uses orjson for both directions.
+        """
+        response = await self.client.post(url, content=orjson.dumps(payload), headers=JSON_HEADERS, timeout=timeout)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+    async def get_embedding(self, text: str, model_name: str = "nomic-embed-text") -> List[float]:
         """
         Takes a text input and returns its vector embedding using the specified Ollama model.
 
@@ -25,34 +82,74 @@ class OllamaClient:
         Returns:
             List[float]: A list of floats representing the vector embedding or an empty list on failure.
         """
-        url = f"{self.api_base_url}/api/embeddings" 
-        
+        url = f"{self.api_base_url}/api/embeddings"
+
         payload = {
             "model": model_name,
             "prompt": text,
-            "stream": False 
+            "stream": False
         }
 
         try:
-            response = requests.post(url, json=payload, timeout=60)
-            response.raise_for_status()
-            data = response.json()
-            
+            data = await self._post_json(url, payload, timeout=60)
+
             return data.get("embedding", [])
-            
-        except requests.exceptions.HTTPError as e:
+
+        except httpx.HTTPStatusError as e:
             print(f"HTTP-error on connection with Ollama: {e}")
-            print(f"Details: {response.text}")
+            print(f"Details: {e.response.text}")
             return []
-        except requests.exceptions.RequestException as e:
+        except httpx.RequestError as e:
             print(f"Error on connection with Embedding: {e}")
             print("Make sure the embedding model is pulled and Ollama is running.")
             return []
         except Exception as e:
             print(f"An unexpected error occured: {e}")
             return []
-        
-    def generate(self, prompt: str, model_name: str = "llama3", system_prompt: str = None, json_mode: bool = False) -> str | None:
+
+    async def get_embeddings_batch(self, texts: List[str], model_name: str = "nomic-embed-text", batch_size: int = 32) -> List[List[float]]:
+        """
+        Embeds many texts with as few requests as possible using the batch endpoint "/api/embed".
+        Falls back to one "/api/embeddings" request per text if the server does not return "embeddings".
+
+        Args:
+            texts (List[str]): The texts that the user wants to be embedded.
+            model_name (str): The name of the used model.
+            batch_size (int): Maximum number of texts sent in a single request.
+
+        Returns:
+            List[List[float]]: One embedding per input text, in input order. Failed texts get an empty list.
+        """
+        url = f"{self.api_base_url}/api/embed"
+        embeddings = []
+
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            payload = {
+                "model": model_name,
+                "input": chunk
+            }
+
+            try:
+                data = await self._post_json(url, payload, timeout=120)
+
+                if "embeddings" in data:
+                    embeddings.extend(data["embeddings"])
+                    continue
+
+            except httpx.HTTPError as e:
+                print(f"Batch embedding failed, falling back to single requests: {e}")
+            except Exception as e:
+                print(f"An unexpected error occured: {e}")
+
+            # Older Ollama versions only offer the single-prompt endpoint; one request at a time,
+            # so a fallback batch occupies a single slot of the caller's concurrency limit
+            for text in chunk:
+                embeddings.append(await self.get_embedding(text, model_name))
+
+        return embeddings
+
+    async def generate(self, prompt: str, model_name: str = "llama3", system_prompt: str = None, json_mode: bool = False) -> str | None:
         """
         Send a prompt to the Ollama LLM and get the generated response.
 
@@ -66,7 +163,7 @@ class OllamaClient:
             str | None: Raw answer of the model or non if an error occurs.
         """
         url = f"{self.api_base_url}/api/generate"
-        
+
         payload = {
             "model": model_name,
             "prompt": prompt,
@@ -75,24 +172,21 @@ class OllamaClient:
                 "temperature": 0.0 # Use a low temperature for more deterministic output
             }
         }
-        
+
         if system_prompt:
-            payload["system"] = system_prompt 
-        
+            payload["system"] = system_prompt
+
         if json_mode:
             payload["format"] = "json"
 
         try:
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = await self._post_json(url, payload)
 
             return data.get("response")
-            
-        except requests.exceptions.RequestException as e:
+
+        except httpx.HTTPError as e:
             print(f"Error on generating answer: {e}")
             return None
         except Exception as e:
             print(f"An unexpected error occured: {e}")
-            return None
\ No newline at end of file
+            return None
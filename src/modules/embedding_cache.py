@@ -0,0 +1,115 @@
+import hashlib
+import os
+import numpy as np
+
+CACHE_FILE_NAME = ".obsidian-cli-cache.npz"
+INT8_SCALE = 127.0
+
+class EmbeddingCache:
+    """
+    A persistent store of note embeddings, keyed on a hash of the note content.
+    Unchanged notes can reuse their stored embedding instead of asking Ollama again.
+
+    Embeddings are normalized to unit length and stored as int8. Only the direction
+    of a vector matters for cosine similarity, and the rounding error (~1e-2) is far
+    below the margin of the similarity threshold.
+    """
+    def __init__(self, vault_path: str):
+        """
+        Initializes the cache and loads existing entries from the vault root.
+
+        Args:
+            vault_path (str): The absolute path to your Obsidian vault directory.
+        """
+        self.path = os.path.join(vault_path, CACHE_FILE_NAME)
+        self._entries = {}
+        # Keys looked up or stored during this run; everything else is stale on save()
+        self._used = set()
+        self._dirty = False
+        self._load()
+
+    @staticmethod
+    def key(content: str) -> str:
+        """
+        Returns the cache key for a note's content.
+
+        Args:
+            content (str): The text content of the note.
+
+        Returns:
+            str: A hex digest of the content.
+        """
+        return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        """
+        Looks up a stored embedding.
+
+        Args:
+            key (str): The cache key of the note content.
+
+        Returns:
+            np.ndarray | None: The unit-length float32 embedding or None if the content is not cached.
+        """
+        quantized = self._entries.get(key)
+        if quantized is None:
+            return None
+        self._used.add(key)
+        return quantized.astype(np.float32) * (1 / INT8_SCALE)
+
+    def set(self, key: str, embedding) -> None:
+        """
+        Stores an embedding in memory. Call save() to persist it.
+
+        Args:
+            key (str): The cache key of the note content.
+            embedding: The vector embedding of the note.
+        """
+        self._entries[key] = _quantize(np.asarray(embedding, dtype=np.float32))
+        self._used.add(key)
+        self._dirty = True
+
+    def save(self) -> None:
+        """
+        Writes the cache to disk if it changed. Only entries used during this run are
+        kept, so old versions of edited notes and deleted notes are dropped. The file
+        is replaced atomically, so an interrupted run never leaves a corrupt cache behind.
+        """
+        if len(self._used) < len(self._entries):
+            self._entries = {key: self._entries[key] for key in self._used}
+            self._dirty = True
+
+        if not self._dirty or not self._entries:
+            return
+
+        keys = list(self._entries)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, keys=np.array(keys), vectors=np.stack([self._entries[k] for k in keys]))
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except Exception as e:
+            print(f"Could not write embedding cache {self.path}: {e}")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with np.load(self.path) as data:
+                vectors = data["vectors"]
+                if vectors.dtype != np.int8:
+                    raise ValueError(f"unexpected vector type {vectors.dtype}")
+                self._entries = dict(zip(data["keys"].tolist(), vectors))
+        except Exception as e:
+            print(f"Could not read embedding cache {self.path}, starting fresh: {e}")
+            self._entries = {}
+
+
+def _quantize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Normalizes vectors to unit length along the last axis and maps them to int8.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True).clip(min=1e-12)
+    return np.round(vectors / norms * INT8_SCALE).clip(-INT8_SCALE, INT8_SCALE).astype(np.int8)
@@ -1,122 +1,236 @@
-import time
-import requests
+import asyncio
 import os
+import re
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from itertools import islice
 
-def find_and_link_notes_with_embeddings(vault_path:str, ollama_client, SIMILARITY_THRESHOLD:float = 0.75):
+from src.modules.embedding_cache import EmbeddingCache
+from src.models.llm_clients import concurrency_from_env
+from src.modules.vault import iter_md, read_note, write_note
+
+EMBEDDING_BATCH_SIZE = 32
+# nomic-embed-text runs with a 2048 token context in Ollama; ~4 characters make up one token
+EMBEDDING_CHUNK_CHARS = 6000
+MAX_EMBEDDING_CHARS = 32000
+MAX_LINKS_PER_NOTE = 3
+# Rows of the similarity matrix computed at once; bounds memory to SIMILARITY_BLOCK_ROWS x N floats
+SIMILARITY_BLOCK_ROWS = 1024
+WIKILINK_RE = re.compile(r"\[\[([^\]|#]+)")
+
+def iter_notes(vault_path: str):
+    """
+    Walks an Obsidian vault and yields its notes one at a time, so that only
+    the notes currently being embedded have to be kept in memory.
+
+    Args:
+        vault_path (str): The absolute path to your Obsidian vault directory.
+
+    Yields:
+        tuple[str, str, str]: The title, path and content of each Markdown note.
+    """
+    for note_path, title in iter_md(vault_path):
+        try:
+            content = read_note(note_path)
+        except Exception as e:
+            print(f"Could not read file {note_path}: {e}")
+            continue
+        yield title, note_path, content
+
+def split_for_embedding(content: str) -> list[str]:
+    """
+    Cuts a note into pieces that fit the context window of the embedding model.
+    Text beyond MAX_EMBEDDING_CHARS is dropped.
+
+    Args:
+        content (str): The text content of the note.
+
+    Returns:
+        list[str]: At least one chunk of at most EMBEDDING_CHUNK_CHARS characters.
+    """
+    content = content[:MAX_EMBEDDING_CHARS]
+    return [content[i:i + EMBEDDING_CHUNK_CHARS] for i in range(0, len(content), EMBEDDING_CHUNK_CHARS)] or [content]
+
+def _mean_pool(vectors: list[list[float]]) -> np.ndarray | None:
+    """
+    Averages the unit-normalized chunk embeddings of a note. Returns None if any chunk
+    failed, so an embedding of only part of the note is never cached.
+    """
+    if not vectors or not all(vectors):
+        return None
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True).clip(min=1e-12)
+    return matrix.mean(axis=0)
+
+def _ensure_capacity(matrix: np.ndarray | None, rows: int, dim: int) -> np.ndarray:
+    """
+    Returns a float32 matrix with room for at least `rows` rows, growing geometrically.
+    """
+    if matrix is None:
+        return np.empty((max(rows, 64), dim), dtype=np.float32)
+    if rows <= len(matrix):
+        return matrix
+    grown = np.empty((max(rows, 2 * len(matrix)), dim), dtype=np.float32)
+    grown[:len(matrix)] = matrix
+    return grown
+
+def top_k_neighbours(embeddings_matrix: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the k most similar notes for every note, excluding the note itself.
+
+    Args:
+        embeddings_matrix (np.ndarray): Unit-normalized float32 embeddings, one row per note.
+        k (int): Number of neighbours per note, at most the number of notes minus one.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The neighbour indices and their cosine similarities,
+        both of shape (notes, k) and sorted by descending similarity per row.
+    """
+    n = len(embeddings_matrix)
+    indices = np.empty((n, k), dtype=np.intp)
+    scores = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, SIMILARITY_BLOCK_ROWS):
+        block = embeddings_matrix[start:start + SIMILARITY_BLOCK_ROWS] @ embeddings_matrix.T
+        rows = np.arange(len(block))
+
+        # A note should never be matched with itself
+        block[rows, rows + start] = -np.inf
+
+        # Select the k best candidates of every row without sorting whole rows, then order only those
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        indices[start:start + len(block)] = np.take_along_axis(candidates, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(candidate_scores, order, axis=1)
+
+    return indices, scores
+
+async def find_and_link_notes_with_embeddings(vault_path:str, ollama_client, SIMILARITY_THRESHOLD:float = 0.75):
     """
     Scans an Obsidian vault, calculates embeddings for each note, and
     automatically links the most semantically similar notes.
 
     Args:
         vault_path (str): The absolute path to your Obsidian vault directory.
-        ollama_client (str): The initialised ollama object.
+        ollama_client (AsyncOllamaClient): The initialised ollama object.
     """
     print(f"Scanning vault at: {vault_path}")
 
-    # --- Step 1: Gather notes and their content ---
-    all_notes = []
-    for root, _, files in os.walk(vault_path):
-        for file in files:
-            if file.endswith('.md'):
-                note_path = os.path.join(root, file)
-                title = os.path.basename(note_path)[:-3]
-                try:
-                    with open(note_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                    all_notes.append({
-                        "title": title,
-                        "path": note_path,
-                        "content": content
-                    })
-                except Exception as e:
-                    print(f"Could not read file {note_path}: {e}")
-                    continue
-
-    if not all_notes:
+    # --- Step 1 & 2: Stream notes from the vault and embed them window by window ---
+    print("\nGenerating embeddings for all notes...")
+    cache = EmbeddingCache(vault_path)
+    max_workers = concurrency_from_env("OLLAMA_CONCURRENCY")
+    notes = iter_notes(vault_path)
+
+    # At most max_workers embedding requests are in flight, however many chunks a window yields
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def embed(batch):
+        async with semaphore:
+            return await ollama_client.get_embeddings_batch(batch)
+
+    # Titles, paths and embedding rows share the same index
+    titles = []
+    paths = []
+    embeddings_matrix = None
+    note_count = 0
+    cached_count = 0
+    generated_count = 0
+
+    # Read just enough notes to have one batch in flight per allowed concurrent request
+    while window := list(islice(notes, EMBEDDING_BATCH_SIZE * max_workers)):
+        note_count += len(window)
+        keys = [EmbeddingCache.key(content) for _, _, content in window]
+        embeddings = [cache.get(key) for key in keys]
+
+        # Only notes whose content changed since the last run are sent to Ollama
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        cached_count += len(window) - len(missing)
+
+        # Notes with identical content (empty notes, templates) share one embedding
+        unique_contents = {}
+        for i in missing:
+            unique_contents.setdefault(keys[i], window[i][2])
+
+        # Long notes are embedded chunk by chunk; all chunks travel in the same batches
+        chunks_per_note = [split_for_embedding(content) for content in unique_contents.values()]
+        contents = [chunk for chunks in chunks_per_note for chunk in chunks]
+        batches = [contents[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(contents), EMBEDDING_BATCH_SIZE)]
+
+        # asyncio.gather keeps the results in note order
+        results = await asyncio.gather(*(embed(batch) for batch in batches))
+        vectors = iter([vector for batch_vectors in results for vector in batch_vectors])
+        for key, chunks in zip(unique_contents, chunks_per_note):
+            embedding = _mean_pool(list(islice(vectors, len(chunks))))
+            if embedding is not None:
+                cache.set(key, embedding)
+                generated_count += 1
+        for i in missing:
+            embeddings[i] = cache.get(keys[i])
+
+        for (title, note_path, _), embedding in zip(window, embeddings):
+            if embedding is None:
+                continue
+            embeddings_matrix = _ensure_capacity(embeddings_matrix, len(titles) + 1, len(embedding))
+            embeddings_matrix[len(titles)] = embedding
+            titles.append(title)
+            paths.append(note_path)
+
+    cache.save()
+
+    if note_count == 0:
         print("No Markdown files found. Please check the vault path.")
         return
 
-    # --- Step 2: Generate embeddings for all notes ---
-    print("\nGenerating embeddings for all notes...")
-    note_embeddings = []
-    for note in all_notes:
-        embedding = ollama_client.get_embedding(note["content"])
-        if embedding:
-            note_embeddings.append({
-                "title": note["title"],
-                "path": note["path"],
-                "embedding": np.array(embedding)
-            })
-        time.sleep(0.5) # Add a small delay to avoid overwhelming the API
-
-    if not note_embeddings:
+    print(f"{cached_count} embeddings loaded from cache, {generated_count} generated.")
+
+    if not titles:
         print("No embeddings were generated. Exiting.")
         return
 
+    if len(titles) < 2:
+        print("At least two notes are needed to find related notes. Exiting.")
+        return
+
     linked_count = 0
     
     # --- Step 3: Find and link semantically similar notes ---
-    embeddings_matrix = np.array([item["embedding"] for item in note_embeddings])
-    
-    # Calculate the cosine similarity matrix for all notes
-    similarity_matrix = cosine_similarity(embeddings_matrix)
+    embeddings_matrix = embeddings_matrix[:len(titles)]
+
+    # Normalize every embedding to unit length, then the dot product is the cosine similarity
+    embeddings_matrix /= np.linalg.norm(embeddings_matrix, axis=1, keepdims=True).clip(min=1e-12)
+    match_indices, match_scores = top_k_neighbours(embeddings_matrix, min(MAX_LINKS_PER_NOTE, len(titles) - 1))
+
+    # Keep the matches that are above our threshold
+    above_threshold = match_scores > SIMILARITY_THRESHOLD
     
-    # Iterate through each note to find its best matches
-    for i, source_note in enumerate(note_embeddings):
-        source_title = source_note["title"]
-        source_path = source_note["path"]
-        
-        # Get the similarity scores for the current note
-        similarity_scores = similarity_matrix[i]
+    # Only notes with at least one match need to be touched
+    for i in np.flatnonzero(above_threshold.any(axis=1)):
+        source_title = titles[i]
+        source_path = paths[i]
+        top_matches = [(titles[j], score) for j, score in zip(match_indices[i][above_threshold[i]], match_scores[i][above_threshold[i]])]
+
+        print(f"\nFound related notes for '{source_title}':")
+        links_to_add = []
         
-        # Get the indices of the notes sorted by similarity (descending)
-        # starting from index 1 to skip the note itself
-        sorted_indices = np.argsort(similarity_scores)[::-1][1:]
+        # Read the current content of the source note to check for existing links
+        current_content = read_note(source_path)
+
+        # Link targets already present in the note, ignoring aliases and headings
+        existing_links = {target.strip() for target in WIKILINK_RE.findall(current_content)}
         
-        # Find the top N most similar notes, excluding the source note
-        top_matches = []
-        for j in sorted_indices:
-            # Skip the note if it's the same as the source note
-            if i == j:
-                continue
-            
-            target_note = note_embeddings[j]
-            similarity = similarity_scores[j]
-            
-            # Check if the similarity is above our threshold
-            if similarity > SIMILARITY_THRESHOLD:
-                top_matches.append((target_note, similarity))
-            
-            # Stop if we have enough matches (e.g., top 3)
-            if len(top_matches) >= 3:
-                break
+        for target_title, score in top_matches:
+            # Check if the link already exists in the file to avoid duplicates
+            if target_title not in existing_links:
+                links_to_add.append(f"[[{target_title}]]")
+                print(f"  - {target_title} (Similarity: {score:.2f})")
+                linked_count += 1
         
-        if top_matches:
-            print(f"\nFound related notes for '{source_title}':")
-            links_to_add = []
-            
-            # Read the current content of the source note to check for existing links
-            with open(source_path, 'r', encoding='utf-8') as f:
-                current_content = f.read()
-            
-            for match, score in top_matches:
-                target_title = match["title"]
-                
-                # Check if the link already exists in the file to avoid duplicates
-                if f"[[{target_title}]]" not in current_content:
-                    links_to_add.append(f"[[{target_title}]]")
-                    print(f"  - {target_title} (Similarity: {score:.2f})")
-                    linked_count += 1
-            
-            # If we have new links to add, append them to the end of the note
-            if links_to_add:
-                new_content = current_content.strip() + "\n\n### Related Notes\n" + "\n".join(links_to_add)
-                with open(source_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                print(f"Updated: {os.path.basename(source_path)}")
-                time.sleep(1) # Delay to not overwhelm the file system
+        # If we have new links to add, append them to the end of the note
+        if links_to_add:
+            new_content = current_content.strip() + "\n\n### Related Notes\n" + "\n".join(links_to_add)
+            write_note(source_path, new_content)
+            print(f"Updated: {os.path.basename(source_path)}")
 
     print(f"\nCompleted! Linked a total of {linked_count} notes.")
     print("Please check your vault for the new links under 'Related Notes' headings.")
\ No newline at end of file
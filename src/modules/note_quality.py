@@ -1,11 +1,22 @@
-import requests
-import json
+import asyncio
+import orjson
 import re
-import time
 import os
 import yaml
 
-def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
+from src.models.llm_clients import concurrency_from_env
+from src.modules.vault import iter_md, read_note, write_note
+
+# The libyaml bindings parse and emit much faster than the pure-Python implementation
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+FRONTMATTER_RE = re.compile(r"^---\s*\n(?P<yaml_content>.*?)\n---\s*\n", re.DOTALL)
+RATING_IN_YAML_RE = re.compile(r"^rating\s*:", re.MULTILINE)
+
+async def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
     """
     Sends a note's content to a language model to get a rating and feedback.
     The model is instructed to respond in a structured JSON format.
@@ -39,7 +50,7 @@ def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
 
     try:
         print(f"  > Getting rating from Ollama ...")
-        raw_response = ollama_client.generate(
+        raw_response = await ollama_client.generate(
             prompt=RATING_PROMPT_TEMPLATE, 
             json_mode=True 
         )
@@ -49,12 +60,7 @@ def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
             return {}
                 
         try:
-            if raw_response.startswith("```json"):
-                raw_response = raw_response[7:]
-            if raw_response.endswith("```"):
-                raw_response = raw_response[:-3]
-
-            rating_data = json.loads(raw_response.strip())
+            rating_data = orjson.loads(raw_response.strip().removeprefix("```json").removesuffix("```").strip())
 
             if "rating" in rating_data and "feedback" in rating_data:
                 print(f"  > Rating: {rating_data['rating']} and feedback.")
@@ -62,7 +68,7 @@ def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
             else:
                 print(f"Did not receive a valid JSON format from model: {rating_data}")
                 return {}
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"Error on parsing the JSON response of Ollama: {e}")
             return {}
         except Exception as e:
@@ -73,57 +79,152 @@ def get_note_rating_from_ollama(text: str, ollama_client) -> dict:
         print(f"An unexpected error occured while getting rating from Ollama: {e}")
         return {}
     
-def rate_notes(vault_path: str, ollama_client):
+async def rate_notes(vault_path: str, ollama_client):
     """
     Analyzes each note in the vault, gets a rating from an LLM, and adds
     a 'Note Quality' section with the rating and feedback.
 
     Args:
         vault_path (str): The absolute path to your Obsidian vault directory.
-        ollama_client: Initialised ollama client.
+        ollama_client (AsyncOllamaClient): Initialised ollama client.
     """
-    for root, _, files in os.walk(vault_path):
-        for file in files:
-            if file.endswith(".md"):
-                file_path = os.path.join(root, file)
-                print(f"Processing note: {file_path}")
-                
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
+    file_paths = [file_path for file_path, _ in iter_md(vault_path)]
+    print(f"Found {len(file_paths)} notes.\n")
 
-                # Get the rating from Ollama
-                rating_result = get_note_rating_from_ollama(content, ollama_client)
-                
-                if rating_result:
-                    rating = rating_result.get("rating")
-                    feedback = rating_result.get("feedback")
-                    
-                    # Split the content to find the YAML frontmatter
-                    yaml_match = re.search(r"^---\s*\n(?P<yaml_content>.*?)\n---\s*\n", content, re.DOTALL)
-                    
-                    if yaml_match:
-                        # An existing YAML block was found
-                        yaml_data = yaml.safe_load(yaml_match.group("yaml_content")) or {}
-                        
-                        if "rating" in yaml_data:
-                            print("  > Note already has a rating in the frontmatter. Skipping.\n")
-                            continue
-                        
-                        yaml_data["rating"] = rating
-                        yaml_data["feedback"] = feedback
-                        
-                        updated_yaml_str = yaml.safe_dump(yaml_data, sort_keys=False)
-                        
-                        # Re-assemble the content with the updated YAML
-                        new_content = f"---\n{updated_yaml_str}---\n{content[yaml_match.end():]}"
-                    else:
-                        # No existing YAML block, create a new one
-                        new_yaml_block = f"---\nrating: {rating}\nfeedback: {feedback}\n---\n"
-                        new_content = new_yaml_block + content
-                    
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        f.write(new_content)
-                    
-                    print(f"  > Added rating to {file}\n")
-                else:
-                    print(f"  > Failed to get rating for {file}, skipping.\n")
\ No newline at end of file
+    # Bounds how many generate requests Ollama has to serve at the same time
+    semaphore = asyncio.Semaphore(concurrency_from_env("OLLAMA_GEN_CONCURRENCY"))
+
+    async def rate(file_path):
+        async with semaphore:
+            # Notes are read only when their turn comes, so just the notes in flight are held in memory
+            content = await asyncio.to_thread(read_unrated_note, file_path)
+            if content is None:
+                return file_path, None
+            print(f"Processing note: {file_path}")
+            return file_path, await get_note_rating_from_ollama(content, ollama_client)
+
+    # Each note is written here as soon as its rating arrives
+    for future in asyncio.as_completed([rate(file_path) for file_path in file_paths]):
+        file_path, rating_result = await future
+        if rating_result is None:
+            continue
+        file = os.path.basename(file_path)
+
+        if not rating_result:
+            print(f"  > Failed to get rating for {file}, skipping.\n")
+            continue
+
+        # Read the note again, so edits made while the model was busy are kept
+        content = read_unrated_note(file_path)
+        if content is None:
+            continue
+
+        try:
+            new_content = add_rating_to_frontmatter(content, FRONTMATTER_RE.search(content), rating_result)
+        except (yaml.YAMLError, ValueError) as e:
+            print(f"  > Could not update the frontmatter of {file}, skipping: {e}\n")
+            continue
+        if new_content is None:
+            print(f"  > {file} already has a rating in the frontmatter. Skipping.\n")
+            continue
+        write_note(file_path, new_content)
+        print(f"  > Added rating to {file}\n")
+
+def read_unrated_note(file_path: str) -> str | None:
+    """
+    Reads a note if it still needs a rating. The frontmatter is checked here,
+    before the note is sent to the LLM, so rated notes cost no inference.
+
+    Args:
+        file_path (str): The absolute path to the note.
+
+    Returns:
+        str | None: The content of the note, or None if it is already rated or cannot be read.
+    """
+    try:
+        content = read_note(file_path)
+    except Exception as e:
+        print(f"Could not read file {file_path}: {e}")
+        return None
+
+    # Split the content to find the YAML frontmatter
+    yaml_match = FRONTMATTER_RE.search(content)
+
+    try:
+        if yaml_match and has_rating(yaml_match.group("yaml_content")):
+            print(f"{os.path.basename(file_path)} already has a rating in the frontmatter. Skipping.")
+            return None
+    except (yaml.YAMLError, ValueError) as e:
+        print(f"Could not parse the frontmatter of {file_path}, skipping: {e}")
+        return None
+
+    return content
+
+def has_rating(yaml_content: str) -> bool:
+    """
+    Checks whether a frontmatter block already contains a rating.
+    A plain 'rating:' line is found without parsing; only other spellings need a full YAML parse.
+
+    Args:
+        yaml_content (str): The raw YAML between the frontmatter fences.
+
+    Returns:
+        bool: True if the frontmatter has a "rating" property.
+
+    Raises:
+        ValueError: If the frontmatter is not a mapping of properties (e.g. a list).
+    """
+    if RATING_IN_YAML_RE.search(yaml_content):
+        return True
+    yaml_data = _load_frontmatter(yaml_content)
+    return "rating" in yaml_data
+
+def _load_frontmatter(yaml_content: str) -> dict:
+    """
+    Parses a frontmatter block, which has to be a mapping of properties. An empty block gives {}.
+    """
+    yaml_data = yaml.load(yaml_content, Loader=SafeLoader)
+    if yaml_data is None:
+        return {}
+    if not isinstance(yaml_data, dict):
+        raise ValueError(f"frontmatter is a {type(yaml_data).__name__}, not a mapping of properties")
+    return yaml_data
+
+def add_rating_to_frontmatter(content: str, yaml_match: re.Match | None, rating_result: dict) -> str | None:
+    """
+    Adds the rating and feedback as properties to the frontmatter of a note.
+    An existing rating is never overwritten.
+
+    Args:
+        content (str): The text content of the note.
+        yaml_match (re.Match | None): The match of FRONTMATTER_RE on the content, if any.
+        rating_result (dict): The rating and feedback returned by the model.
+
+    Returns:
+        str | None: The new content of the note, or None if the frontmatter already has a rating.
+
+    Raises:
+        ValueError: If the frontmatter is not a mapping of properties (e.g. a list).
+    """
+    rating = rating_result.get("rating")
+    feedback = rating_result.get("feedback")
+    
+    if yaml_match:
+        # An existing YAML block was found
+        yaml_data = _load_frontmatter(yaml_match.group("yaml_content"))
+        
+        # Catches spellings the RATING_IN_YAML_RE fast path misses, e.g. '"rating": 5'
+        if "rating" in yaml_data:
+            return None
+        
+        yaml_data["rating"] = rating
+        yaml_data["feedback"] = feedback
+        
+        updated_yaml_str = yaml.dump(yaml_data, Dumper=SafeDumper, sort_keys=False)
+        
+        # Re-assemble the content with the updated YAML
+        return f"---\n{updated_yaml_str}---\n{content[yaml_match.end():]}"
+
+    # No existing YAML block, create a new one
+    new_yaml_block = f"---\nrating: {rating}\nfeedback: {feedback}\n---\n"
+    return new_yaml_block + content
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+def iter_md(vault_path: str):
+    """
+    Walks an Obsidian vault and yields every Markdown file in it.
+    Uses os.scandir, whose entries already know their file type, so no extra
+    stat call is needed per file.
+
+    Args:
+        vault_path (str): The absolute path to your Obsidian vault directory.
+
+    Yields:
+        tuple[str, str]: The path and the title (file name without ".md") of each note.
+    """
+    stack = [vault_path]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.md'):
+                        yield entry.path, entry.name[:-3]
+        except OSError as e:
+            print(f"Could not scan directory {directory}: {e}")
+
+def read_note(file_path: str) -> str:
+    """
+    Reads a whole note with an unbuffered read sized to the file, skipping
+    the buffered text-mode reader and its extra copy.
+
+    Args:
+        file_path (str): The absolute path to the note.
+
+    Returns:
+        str: The decoded content, with line endings normalized to "\\n" like text mode does.
+    """
+    fd = os.open(file_path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        size = os.fstat(fd).st_size
+        data = os.read(fd, size)
+        # A single read may return less than requested, e.g. if the file grew meanwhile
+        while chunk := os.read(fd, max(size - len(data), 65536)):
+            data += chunk
+    finally:
+        os.close(fd)
+
+    content = data.decode('utf-8')
+    if "\r" in content:
+        content = content.replace("\r\n", "\n").replace("\r", "\n")
+    return content
+
+def write_note(file_path: str, content: str) -> None:
+    """
+    Replaces the content of a note atomically. The text is written to a temporary
+    file next to the note first, so an interrupted run never leaves a half-written note.
+
+    Args:
+        file_path (str): The absolute path to the note.
+        content (str): The new content of the note.
+    """
+    # Write through symlinks like open(path, 'w') does, instead of replacing the link itself
+    target = os.path.realpath(file_path)
+    tmp_path = target + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        # The temporary file was created with default permissions; keep those of the note
+        if os.path.exists(target):
+            shutil.copymode(target, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise